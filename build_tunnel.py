@@ -1,5 +1,6 @@
 import argparse
-import contextlib
+import functools
+import importlib.util
 import os
 import shutil
 import subprocess
@@ -16,24 +17,26 @@ cwd = Path.cwd()
 tunnel = cwd / "src/tunnel.py"
 
 
-@contextlib.contextmanager
-def workdir(dir: str):
-    _cwd = os.getcwd()
-    os.chdir(dir)
+@functools.lru_cache(maxsize=None)
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def link_or_copy(src: Path, dst: Path):
+    # hardlink when possible, fallback to copy e.g. when dst is on another device
+    dst.unlink(missing_ok=True)
     try:
-        yield
-    finally:
-        os.chdir(_cwd)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
 
 
 if args.with_test:
     print("Run Test")
-    import importlib.util
-
-    if not importlib.util.find_spec("pytest"):
+    if not has_module("pytest"):
         print("pytest not found, install it first or run without --with-test")
         sys.exit(1)
-    if not importlib.util.find_spec("pytest_mock"):
+    if not has_module("pytest_mock"):
         print("pytest-mock not found, install it first or run without --with-test")
         sys.exit(1)
 
@@ -43,32 +46,30 @@ if args.with_test:
         print(e)
         sys.exit(e.returncode)
 
-with tempfile.TemporaryDirectory() as tmp_dir:
-    print("Build")
-    import importlib.util
-
-    if not importlib.util.find_spec("cloudpickle"):
-        print("cloudpickle not found, install it first or run without --with-test")
-        sys.exit(1)
+print("Build")
+if not has_module("cloudpickle"):
+    print("cloudpickle not found, install it first")
+    sys.exit(1)
 
+with tempfile.TemporaryDirectory() as tmp_dir:
     tmp_dir = Path(tmp_dir)
     tunnel_pkl = tunnel.with_suffix(".pkl")
-    shutil.copy(tunnel.absolute(), tmp_dir)
-    with workdir(tmp_dir):
-        subprocess.run(
-            [
-                sys.executable,
-                "-c",
-                textwrap.dedent(
-                    f"""
-                    import cloudpickle as p
-                    import tunnel
-                    p.register_pickle_by_value(tunnel)
-                    with open("{tunnel.with_suffix('.pkl').name}", "wb") as f:
-                        f.write(p.dumps(tunnel.Tunnel))
-                    """
-                ),
-            ]
-        )
+    link_or_copy(tunnel.absolute(), tmp_dir / tunnel.name)
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            textwrap.dedent(
+                f"""
+                import cloudpickle as p
+                import tunnel
+                p.register_pickle_by_value(tunnel)
+                with open("{tunnel.with_suffix('.pkl').name}", "wb") as f:
+                    f.write(p.dumps(tunnel.Tunnel))
+                """
+            ),
+        ],
+        cwd=tmp_dir,
+    )
     print(f"Copy {tmp_dir / tunnel_pkl.name} to {cwd / tunnel_pkl.name}")
-    shutil.copy(tmp_dir / tunnel_pkl.name, cwd / tunnel_pkl.name)
+    link_or_copy(tmp_dir / tunnel_pkl.name, cwd / tunnel_pkl.name)
@@ -3,32 +3,113 @@ import sys
 if sys.version_info < (3, 8):
     raise RuntimeError(f"Minimum python version is 3.8, you have {sys.version}")
 
+import functools
 import logging
 import os
 import re
+import selectors
 import shlex
 import signal
 import socket
 import subprocess
 import time
+import weakref
 from pathlib import Path
 from threading import Event, Lock, Thread
-from typing import Callable, List, Optional, Tuple, TypedDict, Union, get_args
+from typing import (
+    Callable,
+    List,
+    Optional,
+    Tuple,
+    TypedDict,
+    Union,
+    get_args,
+)
 
 StrOrPath = Union[str, Path]
 StrOrRegexPattern = Union[str, re.Pattern]
 ListHandlersOrBool = Union[List[logging.Handler], bool]
 
+_POSIX = os.name != "nt"
+
+# handlers created by Tunnel for its own logger
+_OWN_HANDLERS: "weakref.WeakSet[logging.Handler]" = weakref.WeakSet()
+
+# maximum bytes read from tunnel output at once
+_READ_SIZE = 64 * 1024
+
+# prefix of the named group wrapping each tunnel pattern in the combined regex,
+# kept unusual so it doesn't clash with group names used in the patterns
+_GROUP_PREFIX = b"_tunnel_"
+
+# regex flags that can be scoped to a single group as inline flags
+_INLINE_FLAGS = (
+    (re.IGNORECASE, b"i"),
+    (re.MULTILINE, b"m"),
+    (re.DOTALL, b"s"),
+)
+_COMBINABLE_FLAGS = re.ASCII | re.IGNORECASE | re.MULTILINE | re.DOTALL
+
+# pattern text that can't be pasted into the combined regex: group references,
+# as the group numbers shift, and global inline flags, that must come first
+_NOT_COMBINABLE = re.compile(rb"\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+@functools.lru_cache(maxsize=None)
+def _log_prefix(name: str) -> str:
+    names = name.split(".") if name else []
+    if len(names) > 1:
+        _, *names = names
+        return f"[{' '.join(names)}] "
+    return ""
+
+
+def _check_tunnel_args(command: str, pattern: StrOrRegexPattern, name: str) -> None:
+    """
+    Check the types of the required `Tunnel.add_tunnel` arguments.
+
+    Raises:
+        TypeError: Raised if `command`, `pattern` or `name` has the wrong type
+    """
+    if not isinstance(command, str) or not isinstance(name, str):
+        raise TypeError("command and name must be str")
+    if not isinstance(pattern, get_args(StrOrRegexPattern)):
+        raise TypeError(
+            f"pattern must be str or re.Pattern, got {type(pattern).__name__}"
+        )
+
+
+def _match_url(match: re.Match) -> str:
+    """
+    Get the URL matched by a tunnel pattern.
+
+    Patterns may match only the host, in that case the scheme right before the
+    match is used, or `http://` if there is none.
+    """
+    link = match.group()
+    start = match.start()
+    before = match.string[max(start - len("https://"), 0) : start]
+    if isinstance(link, bytes):
+        link = link.decode("utf-8", "replace")
+        before = before.decode("utf-8", "replace")
+    link = link.strip()
+    if link.startswith(("http://", "https://")):
+        return link
+    return ("https://" if before.endswith("https://") else "http://") + link
+
 
 class CustomLogFormat(logging.Formatter):
-    def format(self, record: logging.LogRecord) -> str:
-        names = record.name.split(".") if record.name else []
-        if len(names) > 1:
-            _, *names = names
-            record.msg = f"[{' '.join(names)}] {record.msg}"
-        else:
-            record.msg = f"{record.msg}"
-        return super().format(record)
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        prefix = _log_prefix(record.name)
+        if not prefix:
+            return super().formatMessage(record)
+        # prefix only the formatted output, the record is shared by all handlers
+        message = record.message
+        record.message = prefix + message
+        try:
+            return super().formatMessage(record)
+        finally:
+            record.message = message
 
 
 class TunnelDict(TypedDict):
@@ -41,6 +122,23 @@ class TunnelDict(TypedDict):
     ]  # (url, note, name) -> None
 
 
+_TUNNEL_KEYS = frozenset(TunnelDict.__annotations__)
+
+
+class _TunnelOutput:
+    """
+    Output state of a running tunnel process.
+    """
+
+    __slots__ = ("process", "log", "buffer", "url_extracted")
+
+    def __init__(self, process: subprocess.Popen, log: logging.Logger):
+        self.process = process
+        self.log = log
+        self.buffer = bytearray()
+        self.url_extracted = False
+
+
 class Tunnel:
     def __init__(
         self,
@@ -74,42 +172,65 @@ class Tunnel:
         """
         self._is_running = False
 
-        self.urls: List[Tuple[str, Optional[str], Optional[str]]] = []
-        self.urls_lock = Lock()
+        # one slot for each tunnel in `tunnel_list`, filled with (url, note, name)
+        # by the reader of the matching output
+        self._url_slots: List[Optional[Tuple[str, Optional[str], str]]] = []
+        # guards filling the slots and recompiling the combined regex, which
+        # happens only a few times per run
+        self._url_lock = Lock()
+        self._combined: Optional[Tuple[Optional[re.Pattern], List[int]]] = None
 
         self.jobs: List[Thread] = []
-        self.processes: List[subprocess.Popen] = []
+        # one slot for each tunnel in `tunnel_list`, set by the job spawning it
+        self.processes: List[Optional[subprocess.Popen]] = []
         self.tunnel_list: List[TunnelDict] = []
+        # (pattern, note, name, callback) of each tunnel in `tunnel_list`,
+        # built from it when the tunnels start
+        self._compiled_tunnels: List[
+            Tuple[re.Pattern, Optional[str], str, Optional[Callable]]
+        ] = []
 
         self.stop_event: Event = Event()
         self.printed = Event()
+        self._urls_ready = Event()
+        self._port_up = Event()
+        # stop() writes to this pipe to wake up the selector in _run
+        self._stop_pipe: Optional[Tuple[int, int]] = None
 
         self.port = port
         self.check_local_port = check_local_port
         self.debug = debug
         self.timeout = timeout
+        self.propagate = propagate
         self.log_handlers = log_handlers
+        # kept as given, so a pickled tunnel resolves the default log_dir again
+        self._log_dir_arg = log_dir
         self.log_dir = log_dir or os.getcwd()
         self.callback = callback
 
         self.logger = logging.getLogger(f"Tunnel {hex(id(self))}")
         # root logger is set to DEBUG by default
         self.logger.setLevel(logging.DEBUG)
+        # the logger name is based on id(), which can be reused once a previous
+        # instance is garbage collected, so drop whatever handlers it left behind
+        # and close the ones created by Tunnel, `log_handlers` belong to the user
+        for i in self.logger.handlers:
+            if i in _OWN_HANDLERS:
+                i.close()
+        self.logger.handlers.clear()
         self.logger_format = CustomLogFormat(
             "[%(asctime)s %(levelname)s]: %(message)s", datefmt="%X"
         )
         # write our own logger format when propagate is false
+        # log_handlers=False disables logging to the console
         if not propagate:
             self.logger.propagate = False
-            if not self.logger.handlers:
+            if self.log_handlers is not False:
                 handler = logging.StreamHandler()
                 handler.setFormatter(self.logger_format)
                 self.logger.addHandler(handler)
-        # disable logging if log_handlers is False
-        if self.log_handlers is False:
-            for i in self.logger.handlers:
-                self.logger.removeHandler(i)
-        elif isinstance(self.log_handlers, list):
+                _OWN_HANDLERS.add(handler)
+        if isinstance(self.log_handlers, list):
             for i in self.log_handlers:
                 self.logger.addHandler(i)
         # set level of all handlers to DEBUG if debug is True, INFO otherwise
@@ -122,8 +243,9 @@ class Tunnel:
         file_handler.setFormatter(self.logger_format)
         file_handler.setLevel(logging.DEBUG)
         self.logger.addHandler(file_handler)
+        _OWN_HANDLERS.add(file_handler)
 
-        self.WINDOWS = True if os.name == "nt" else False
+        self.WINDOWS = not _POSIX
         self.logger.info("Initializing Tunnel")
         self.logger.info("Python version " + sys.version)
 
@@ -166,23 +288,25 @@ class Tunnel:
         Note:
             output of each tunnel command will be saved to `log_dir`
         """
-        if not tunnel_list or not all(
-            isinstance(i, dict)
-            and {"command", "pattern", "name"}.issubset(i)
-            and isinstance(i["command"], str)
-            and isinstance(i["pattern"], get_args(StrOrRegexPattern))
-            and isinstance(i["name"], str)
-            for i in tunnel_list
-        ):
-            raise ValueError(
-                "tunnel_list must be a list of dictionaries with required key-value pairs:\n"
-                "  command: str\n"
-                "  pattern: StrOrRegexPattern\n"
-                "  name: str\n"
-                "optional key-value pairs:\n"
-                "  note: str\n"
-                "  callback: Callable[[str, str, str], None]"
-            )
+        error = ValueError(
+            "tunnel_list must be a list of dictionaries with required key-value pairs:\n"
+            "  command: str\n"
+            "  pattern: StrOrRegexPattern\n"
+            "  name: str\n"
+            "optional key-value pairs:\n"
+            "  note: str\n"
+            "  callback: Callable[[str, str, str], None]"
+        )
+        # validate before creating the instance, which opens the log file
+        if not tunnel_list:
+            raise error
+        for tunnel in tunnel_list:
+            if not isinstance(tunnel, dict) or not _TUNNEL_KEYS.issuperset(tunnel):
+                raise error
+            try:
+                _check_tunnel_args(tunnel["command"], tunnel["pattern"], tunnel["name"])
+            except (KeyError, TypeError) as e:
+                raise error from e
         init_cls = cls(
             port,
             check_local_port=check_local_port,
@@ -217,12 +341,22 @@ class Tunnel:
             callback (Callable[[str, Optional[str], Optional[str]], None], optional): A callback function to be called when when the regex pattern matched.\
                 will call `callback(url, note, name) -> None`. Defaults to `None`.
 
+        Raises:
+            TypeError: Raised if `command`, `pattern` or `name` has the wrong type
+
         Note:
             `name` must be unique name as is being used for `.log` file,
         """
-        # compile pattern
+        _check_tunnel_args(command, pattern, name)
+        # compile pattern to bytes, tunnel output is matched without decoding it.
+        # non-ASCII patterns would mean something else as UTF-8 bytes, those are
+        # kept as str and matched against the decoded output instead
         if isinstance(pattern, str):
             pattern = re.compile(pattern)
+        if isinstance(pattern.pattern, str) and pattern.pattern.isascii():
+            pattern = re.compile(
+                pattern.pattern.encode(), pattern.flags & ~re.UNICODE | re.ASCII
+            )
 
         log = self.logger
         log.debug(f"Adding tunnel {command=} {pattern=} {name=} {note=} {callback=}")
@@ -257,20 +391,15 @@ class Tunnel:
         if self._is_running:
             raise RuntimeError("Tunnel is already running")
 
-        _check_local_port = self.check_local_port
-        self.check_local_port = False
-
         log = self.logger
-        self.__enter__()
+        # start() blocks until the URLs are printed, so don't wait for the local port
+        self._start(check_local_port=False)
 
         try:
-            while not self.printed.is_set():
-                time.sleep(1)
+            self._wait_event(self.printed)
         except KeyboardInterrupt:
             log.warning("Keyboard Interrupt detected, stopping tunnel")
             self.stop()
-        finally:
-            self.check_local_port = _check_local_port
 
     def stop(self) -> None:
         """
@@ -285,8 +414,15 @@ class Tunnel:
         log = self.logger
         log.info("Stopping tunnel")
         self.stop_event.set()
+        # wake up the jobs waiting for the port or the URLs
+        self._port_up.set()
+        self._urls_ready.set()
+        if self._stop_pipe:
+            os.write(self._stop_pipe[1], b"\0")
 
         for process in self.processes:
+            if process is None:
+                continue
             log.debug(f"Stopping {process}")
             while process.poll() is None:
                 try:
@@ -308,30 +444,98 @@ class Tunnel:
     def get_port(self) -> int:
         return self.port
 
+    @property
+    def urls(self) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        URLs found so far as `(url, note, name)`, in the order the tunnels were added.
+        """
+        return [url for url in self._url_slots if url]
+
+    def __getstate__(self) -> dict:
+        """
+        Get the configuration of the tunnel for pickling.
+
+        Runtime state like the logger, events and processes is left out, so a
+        running tunnel is pickled as a new, stopped one. Custom `log_handlers`
+        are dropped as handlers generally can't be pickled.
+
+        Note:
+            the `callback` of the tunnel and of each tunnel in `tunnel_list` is
+            pickled as well, so they must be picklable, e.g. module level functions
+            rather than lambdas or closures.
+        """
+        return dict(
+            port=self.port,
+            check_local_port=self.check_local_port,
+            debug=self.debug,
+            timeout=self.timeout,
+            propagate=self.propagate,
+            log_handlers=self.log_handlers if self.log_handlers is False else None,
+            log_dir=self._log_dir_arg,
+            callback=self.callback,
+            tunnel_list=self.tunnel_list,
+        )
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Initialize the tunnel from the configuration returned by `__getstate__`.
+        """
+        tunnel_list = state.pop("tunnel_list")
+        self.__init__(**state)
+        for tunnel in tunnel_list:
+            self.add_tunnel(**tunnel)
+
     def __enter__(self):
+        return self._start(check_local_port=self.check_local_port)
+
+    def _start(self, check_local_port: bool):
+        """
+        Start the tunnel jobs.
+
+        Args:
+            check_local_port (bool): Flag to wait for the local port before running the tunnels.
+
+        Raises:
+            RuntimeError: Raised if tunnel is already running
+            ValueError: Raised if no tunnels are added
+        """
         if self._is_running:
             raise RuntimeError("Tunnel is already running by another method")
 
         if not self.tunnel_list:
             raise ValueError("No tunnels added")
 
+        self._prepare_tunnels()
+        if not self.WINDOWS:
+            self._stop_pipe = os.pipe()
+
         log = self.logger
         log.info("Tunnel Started")
 
+        # the print job waits for the local port itself, as it has nothing to print
+        # until then, so there is no separate thread probing the port
+        if not check_local_port:
+            self._port_up.set()
+
         # Add print job
-        print_job = Thread(target=self._print)
+        print_job = Thread(target=self._print, args=(check_local_port,))
         print_job.start()
         self.jobs.append(print_job)
 
         # Add tunnels job
-        for tunnel in self.tunnel_list:
-            cmd = tunnel["command"]
-            name = tunnel.get("name")
-            tunnel_thread = Thread(
-                target=self._run,
-                args=(cmd.format(port=self.port),),
-                kwargs={"name": name},
-            )
+        tunnels = []
+        for i, tunnel in enumerate(self.tunnel_list):
+            if self.WINDOWS:
+                cmd = tunnel["command"].format(port=self.port)
+            else:
+                # {port} is formatted on each argument, so it can't change the split
+                cmd = [
+                    arg.format(port=self.port) for arg in shlex.split(tunnel["command"])
+                ]
+            tunnels.append((i, cmd, tunnel["name"]))
+        # pipes can't be selected on Windows, run a thread for each tunnel there
+        for group in [[t] for t in tunnels] if self.WINDOWS else [tunnels]:
+            tunnel_thread = Thread(target=self._run, args=(group, check_local_port))
             tunnel_thread.start()
             self.jobs.append(tunnel_thread)
 
@@ -345,11 +549,18 @@ class Tunnel:
         """
         Reset internal state.
         """
-        self.urls = []
+        self._url_slots = [None] * len(self.tunnel_list)
+        self._combined = None
         self.jobs = []
-        self.processes = []
+        self.processes = [None] * len(self.tunnel_list)
         self.stop_event.clear()
         self.printed.clear()
+        self._urls_ready.clear()
+        self._port_up.clear()
+        if self._stop_pipe:
+            for fd in self._stop_pipe:
+                os.close(fd)
+            self._stop_pipe = None
         self._is_running = False
 
     @staticmethod
@@ -357,6 +568,10 @@ class Tunnel:
         """
         Check if the specified port is in use.
 
+        The port is probed by connecting to it on localhost, a server accepting
+        the connection is what the tunnels need. A refused connection returns
+        right away, the timeout only applies when the connection hangs.
+
         Args:
             port (int): The port to check.
 
@@ -365,193 +580,347 @@ class Tunnel:
         """
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(1)
-                return s.connect_ex(("localhost", port)) == 0
-        except Exception:
+                s.settimeout(0.5)
+                return s.connect_ex(("127.0.0.1", port)) == 0
+        except (OSError, OverflowError):
+            # OverflowError is raised for a port out of range
             return False
 
-    @staticmethod
-    def wait_for_condition(
-        condition: Callable[[], bool], *, interval: int = 1, timeout: int = 10
-    ) -> bool:
+    def _wait_port(self) -> None:
         """
-        Wait for the condition to be true until the specified timeout.
+        Wait until the local port is in use, then set `_port_up`.
 
-        Mostly for internal use but can be used for anything else.
+        The port is probed with an exponential backoff from 0.1s up to 1s between probes.
+        """
+        interval = 0.1
+        while not self.is_port_in_use(self.port):
+            if self.stop_event.wait(interval):
+                return
+            interval = min(interval * 2, 1)
+        self._port_up.set()
+
+    def _wait_event(self, event: Event, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the event to be set, returning early if `stop_event` is set.
+
+        The wait is done in slices so it stays interruptible by `KeyboardInterrupt`,
+        but setting `event` wakes the caller immediately.
 
         Args:
-            condition (Callable[[], bool]): The condition to check.
-            interval (int, optional): The interval (in seconds) between condition checks.
-            timeout (int, optional): Maximum time to wait for the condition. `None` for no timeout.
+            event (Event): The event to wait for.
+            timeout (float, optional): Maximum time to wait for the event. `None` for no timeout.
 
         Returns:
-            bool: `True` if the condition is met, `False` if timeout is reached.
+            bool: `True` if the event is set, `False` if timeout is reached or `stop_event` is set.
         """
-        start_time = time.time()
-
-        # Initialize variables to track elapsed time and number of checks
-        elapsed_time = 0
-        checks_count = 0
-
-        # Prevent zero or negative timeout
-        if timeout is not None:
-            timeout = max(1, timeout)
-
-        while True:
-            if condition():
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stop_event.is_set():
+            remaining = 1 if deadline is None else min(1, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            if event.wait(remaining):
                 return True
+        return event.is_set()
 
-            checks_count += 1
-
-            if timeout is not None:
-                elapsed_time = time.time() - start_time
-                remaining_time = timeout - elapsed_time
-
-                # If remaining time is non-positive, return False (timeout occurred)
-                if remaining_time <= 0:
-                    return False
-
-                # Adjust the interval to respect the remaining time
-                # and distribute it evenly among the remaining checks
-                next_interval = min(interval, remaining_time / (checks_count + 1))
-            else:
-                next_interval = interval
+    def _prepare_tunnels(self) -> None:
+        """
+        Build the state used while running from `tunnel_list`.
+        """
+        self._compiled_tunnels = [
+            (t["pattern"], t.get("note"), t["name"], t.get("callback"))
+            for t in self.tunnel_list
+        ]
+        self._url_slots = [None] * len(self.tunnel_list)
+        self.processes = [None] * len(self.tunnel_list)
+        self._compile_combined()
+
+    def _compile_combined(self) -> Tuple[Optional[re.Pattern], List[int]]:
+        """
+        Combine the patterns of tunnels without URL into a single regex.
 
-            time.sleep(next_interval)
+        Each pattern is wrapped in a named group `_tunnel_{index}` so the matching tunnel
+        is known from `Match.lastgroup` after a single search. Patterns that can't be
+        combined are left to be searched one by one.
 
-    def _process_line(self, line: str) -> bool:
+        Returns:
+            Tuple[Optional[re.Pattern], List[int]]: The combined bytes pattern, `None` if
+                there is nothing to combine, and the index of each tunnel to search
+                separately.
+        """
+        groups = []
+        separate = []
+        for i, (regex, *_) in enumerate(self._compiled_tunnels):
+            if self._url_slots[i]:
+                continue
+            if (
+                isinstance(regex.pattern, str)
+                or regex.flags & ~_COMBINABLE_FLAGS
+                or _NOT_COMBINABLE.search(regex.pattern)
+            ):
+                separate.append(i)
+                continue
+            flags = b"".join(c for f, c in _INLINE_FLAGS if regex.flags & f)
+            pattern = b"(?%s:%s)" % (flags, regex.pattern) if flags else regex.pattern
+            groups.append(b"(?P<%s%d>%s)" % (_GROUP_PREFIX, i, pattern))
+        try:
+            combined = re.compile(b"|".join(groups), re.ASCII) if groups else None
+        except re.error:
+            # e.g. the same group name used in more than one pattern
+            combined = None
+            separate = [i for i, url in enumerate(self._url_slots) if not url]
+        self._combined = (combined, separate)
+        return self._combined
+
+    def _process_line(self, line: bytes) -> bool:
         """
         Process a line of output to extract tunnel information.
 
         Args:
-            line (str): A line of output from the tunnel process.
+            line (bytes): A line of output from the tunnel process.
 
         Returns:
             bool: True if a URL is extracted, False otherwise.
         """
-        for tunnel in self.tunnel_list:
-            note = tunnel.get("note")
-            name = tunnel.get("name")
-            callback = tunnel.get("callback")
-            regex = tunnel["pattern"]
-            matches = regex.search(line)
-            if matches:
-                link = matches.group().strip()
-                link = link if link.startswith("http") else "http://" + link
-                with self.urls_lock:
-                    self.urls.append((link, note, name))
-                if callback:
-                    try:
-                        callback(link, note, name)
-                    except Exception:
-                        self.logger.error(
-                            "An error occurred while invoking URL callback",
-                            exc_info=True,
-                        )
-                return True
-        return False
+        if None not in self._url_slots:
+            return False
+        combined = self._combined
+        if combined is None:
+            with self._url_lock:
+                combined = self._combined or self._compile_combined()
+        regex, separate = combined
+        matches = regex.search(line) if regex else None
+        if matches:
+            i = int(matches.lastgroup[len(_GROUP_PREFIX) :])
+        else:
+            text = None
+            for i in separate:
+                regex = self._compiled_tunnels[i][0]
+                if isinstance(regex.pattern, str):
+                    if text is None:
+                        text = line.decode("utf-8", "replace")
+                    matches = regex.search(text)
+                else:
+                    matches = regex.search(line)
+                if matches:
+                    break
+            else:
+                return False
+
+        if self._url_slots[i]:
+            return False
+        _, note, name, callback = self._compiled_tunnels[i]
+        link = _match_url(matches)
+        with self._url_lock:
+            # the slot may have been filled from another output since the regex
+            # was compiled, on Windows each output is read by its own thread
+            if self._url_slots[i]:
+                return False
+            self._url_slots[i] = (link, note, name)
+            self._combined = None
+            if None not in self._url_slots:
+                self._urls_ready.set()
+        if callback:
+            try:
+                callback(link, note, name)
+            except Exception:
+                self.logger.error(
+                    "An error occurred while invoking URL callback",
+                    exc_info=True,
+                )
+        return True
 
-    def _run(self, cmd: str, name: str) -> None:
+    def _run(
+        self,
+        tunnels: List[Tuple[int, Union[str, List[str]], str]],
+        check_local_port: bool,
+    ) -> None:
         """
-        Run the tunnel process and monitor its output.
+        Run the tunnel processes and monitor their output.
+
+        On POSIX the output of every process is multiplexed with a selector
+        so a single thread reads all of them. Windows can't select on pipes,
+        so there `tunnels` is expected to hold a single tunnel.
+
+        Args:
+            tunnels (List[Tuple[int, Union[str, List[str]], str]]): The index in `tunnel_list`,
+                command and name of each tunnel to run.
+                The command is a list of arguments on POSIX and a string on Windows.
+            check_local_port (bool): Flag to wait for the local port before running the tunnels.
+        """
+        outputs: List[_TunnelOutput] = []
+        selector = None if self.WINDOWS else selectors.DefaultSelector()
+        logs = [self._get_tunnel_logger(name) for _, _, name in tunnels]
+
+        try:
+            if check_local_port:
+                # Wait until the port is available or stop_event is set
+                for log, (_, _, name) in zip(logs, tunnels):
+                    log.debug(
+                        f"Wait until port: {self.port} online before running the command for {name}"
+                    )
+                self._port_up.wait()
+
+            for log, (i, cmd, _) in zip(logs, tunnels):
+                if self.stop_event.is_set():
+                    break
+                try:
+                    process = subprocess.Popen(
+                        cmd,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        stdin=subprocess.PIPE,
+                        bufsize=0,
+                        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
+                        if self.WINDOWS
+                        else 0,
+                    )
+                except Exception:
+                    log.error(
+                        f"An error occurred while running the command: {cmd}",
+                        exc_info=True,
+                    )
+                    continue
+                self.processes[i] = process
+                output = _TunnelOutput(process, log)
+                outputs.append(output)
+                if selector:
+                    os.set_blocking(process.stdout.fileno(), False)
+                    selector.register(process.stdout, selectors.EVENT_READ, output)
+
+            if selector:
+                if self._stop_pipe:
+                    selector.register(self._stop_pipe[0], selectors.EVENT_READ)
+                running = len(outputs)
+                while running and not self.stop_event.is_set():
+                    for key, _ in selector.select():
+                        if key.data is None:
+                            break  # woken up by stop()
+                        try:
+                            data = os.read(key.fd, _READ_SIZE)
+                        except BlockingIOError:
+                            continue
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            running -= 1
+                        self._process_output(key.data, data)
+            else:
+                for output in outputs:
+                    fd = output.process.stdout.fileno()
+                    read = functools.partial(os.read, fd, _READ_SIZE)
+                    for data in iter(read, b""):
+                        if self.stop_event.is_set():
+                            break
+                        self._process_output(output, data)
+                    self._process_output(output, b"")
+
+        except Exception:
+            self.logger.error(
+                "An error occurred while reading the tunnel output", exc_info=True
+            )
+        finally:
+            if selector:
+                selector.close()
+            for output in outputs:
+                output.process.stdout.close()
+            for log in logs:
+                for handler in log.handlers:
+                    handler.close()
+
+    def _get_tunnel_logger(self, name: str) -> logging.Logger:
+        """
+        Get the logger that writes output of a tunnel to `tunnel_{name}.log`.
 
         Args:
-            cmd (str): The command to execute for the tunnel.
             name (str): Name of the tunnel.
+
+        Returns:
+            logging.Logger: The tunnel logger.
         """
         log_path = Path(self.log_dir, f"tunnel_{name}.log")
 
-        # setup command logger
         log = self.logger.getChild(name)
         log.propagate = False  # do not propagate as the log will be written to a file
-        if not log.handlers:
-            handler = logging.FileHandler(log_path, encoding="utf-8")
-            handler.setLevel(logging.DEBUG)
-            log.addHandler(handler)
+        # replace the handler of the previous run, "w" mode truncates the file on open
+        # and delay=True defers opening it until the tunnel writes its first line
+        for handler in log.handlers[:]:
+            log.removeHandler(handler)
+            handler.close()
+        handler = logging.FileHandler(log_path, mode="w", encoding="utf-8", delay=True)
+        handler.setLevel(logging.DEBUG)
+        log.addHandler(handler)
+        return log
+
+    def _process_output(self, output: _TunnelOutput, data: bytes) -> None:
+        """
+        Split output of a tunnel process into lines and process each of them.
 
-        try:
-            if self.check_local_port:
-                # Wait until the port is available or stop_event is set
-                log.debug(
-                    f"Wait until port: {self.port} online before running the command for {name}"
-                )
-                self.wait_for_condition(
-                    lambda: self.is_port_in_use(self.port) or self.stop_event.is_set(),
-                    interval=1,
-                    timeout=None,
-                )
-            if not self.WINDOWS:
-                cmd = shlex.split(cmd)
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
-                if self.WINDOWS
-                else 0,
-            )
-            self.processes.append(process)
+        A trailing partial line is kept in `output.buffer` until the rest of it
+        is read, empty `data` marks the end of output and flushes the buffer.
 
-            url_extracted = False
-            while not self.stop_event.is_set() and process.poll() is None:
-                line = process.stdout.readline()
-                if not line:
-                    break
-                if not url_extracted:
-                    url_extracted = self._process_line(line)
+        Args:
+            output (_TunnelOutput): Output state of the tunnel process.
+            data (bytes): Data read from the tunnel process.
+        """
+        if data:
+            output.buffer += data
+            lines = output.buffer.split(b"\n")
+            output.buffer = lines.pop()
+        else:
+            lines = [output.buffer] if output.buffer else []
+            output.buffer = bytearray()
 
-                log.debug(line.rstrip())
+        # no need to look for URLs anymore once every tunnel has one
+        if None not in self._url_slots:
+            output.url_extracted = True
 
-        except Exception:
-            log.error(
-                f"An error occurred while running the command: {cmd}", exc_info=True
-            )
-        finally:
-            for handler in log.handlers:
-                handler.close()
+        if not output.url_extracted:
+            for line in lines:
+                output.url_extracted = self._process_line(line)
+                if output.url_extracted:
+                    break
+
+        # the tunnel loggers log at DEBUG so all output is saved to `log_dir`, this
+        # only skips the work when a caller raises the level of a tunnel logger
+        if lines and output.log.isEnabledFor(logging.DEBUG):
+            # log the lines of each read as a single record, the tunnel log has no
+            # formatter so the file gets the same lines as logging them one by one
+            text = b"\n".join(lines).decode("utf-8", "replace")
+            output.log.debug("\n".join(line.rstrip() for line in text.split("\n")))
 
-    def _print(self) -> None:
+    def _print(self, check_local_port: bool) -> None:
         """
         Print the tunnel URLs.
+
+        Args:
+            check_local_port (bool): Flag to wait for the local port before waiting the URLs.
         """
         log = self.logger
         log.info("Getting URLs")
 
-        if self.check_local_port:
+        if check_local_port:
             # Wait until the port is available or stop_event is set
             log.info(f"Wait until port: {self.port} online before print URLs")
-            self.wait_for_condition(
-                lambda: self.is_port_in_use(self.port) or self.stop_event.is_set(),
-                interval=1,
-                timeout=None,
-            )
+            self._wait_port()
             if not self.stop_event.is_set():
                 log.info(
                     f"Port is online, waiting tunnel URLs (timeout: {self.timeout}s)"
                 )
 
         # Wait until all URLs are available or stop_event is set
-        if not self.wait_for_condition(
-            lambda: len(self.urls) == len(self.tunnel_list) or self.stop_event.is_set(),
-            interval=1,
-            timeout=self.timeout,
-        ):
+        if not self._urls_ready.wait(self.timeout) and not self.stop_event.is_set():
             log.warning("Timeout while getting tunnel URLs, print available URLs")
 
         # Print URLs
         if not self.stop_event.is_set():
-            with self.urls_lock:
-                for url, note, _ in self.urls:
-                    log.info(f"* Running on: {url}{(' ' + note) if note else ''}")
-                if self.callback:
-                    try:
-                        self.callback(self.urls)
-                    except Exception:
-                        log.error(
-                            "An error occurred while invoking URLs callback",
-                            exc_info=True,
-                        )
+            urls = self.urls
+            for url, note, _ in urls:
+                log.info(f"* Running on: {url}{(' ' + note) if note else ''}")
+            if self.callback:
+                try:
+                    self.callback(urls)
+                except Exception:
+                    log.error(
+                        "An error occurred while invoking URLs callback",
+                        exc_info=True,
+                    )
             self.printed.set()
@@ -1,10 +1,16 @@
 import logging
+import os
+import pickle
 import re
+import shutil
+import socket
+from pathlib import Path
+from threading import Event, Thread
 
 import pytest
 from pytest_mock import MockerFixture
 
-from src.tunnel import Tunnel
+from src.tunnel import CustomLogFormat, Tunnel, _TunnelOutput
 
 
 @pytest.fixture
@@ -66,8 +72,9 @@ def test_initialize_tunnel_class(
     tunnel = Tunnel(3000, debug=debug)
 
     # Assertions
-    mock_get_logger.assert_called_with("Tunnel")
+    mock_get_logger.assert_called_with(f"Tunnel {hex(id(tunnel))}")
     assert tunnel.logger == mock_logger
+    mock_handlers.clear.assert_called_once_with()
     if not mock_handlers:
         mock_logger.addHandler.assert_called_once_with(mock_handler_instance)
         mock_handler_instance.setLevel.assert_called_once_with(
@@ -75,6 +82,39 @@ def test_initialize_tunnel_class(
         )
 
 
+def test_initialize_tunnel_class_reused_logger(tmp_path, mocker: MockerFixture):
+    user_handler = logging.NullHandler()
+    tunnel = Tunnel(3000, log_handlers=[user_handler], log_dir=tmp_path)
+    file_handler = tunnel.logger.handlers[-1]
+    spy_user_close = mocker.spy(user_handler, "close")
+
+    # a new instance that gets the same logger drops the previous handlers,
+    # but only closes the ones it created itself
+    Tunnel.__init__(tunnel, 3000, log_dir=tmp_path)
+    assert user_handler not in tunnel.logger.handlers
+    assert file_handler not in tunnel.logger.handlers
+    assert len(tunnel.logger.handlers) == 2  # stream and file handler
+    spy_user_close.assert_not_called()
+    assert file_handler.stream is None
+
+    tunnel = Tunnel(3000, log_handlers=False, log_dir=tmp_path)
+    assert [type(i) for i in tunnel.logger.handlers] == [logging.FileHandler]
+    assert not tunnel.logger.propagate
+
+
+def test_custom_log_format():
+    formatter = CustomLogFormat("%(message)s")
+    record = logging.LogRecord("Tunnel.child", logging.INFO, "", 0, "msg", None, None)
+
+    assert formatter.format(record) == "[child] msg"
+    # formatting the same record again (e.g. by another handler) doesn't prefix twice
+    assert formatter.format(record) == "[child] msg"
+    assert record.msg == "msg"
+
+    record = logging.LogRecord("Tunnel", logging.INFO, "", 0, "msg", None, None)
+    assert formatter.format(record) == "msg"
+
+
 def test_with_tunnel_list():
     tunnel = Tunnel.with_tunnel_list(
         3000, [{"command": "cmd", "pattern": "pat", "name": "n", "note": "nt"}]
@@ -88,9 +128,20 @@ def test_with_tunnel_list_empty_list():
         Tunnel.with_tunnel_list(3000, [])
 
 
-def test_with_tunnel_list_invalid_list():
+@pytest.mark.parametrize(
+    "tunnel_list",
+    [
+        [{"command": "cmd", "pattern": 1}],
+        [{"command": "cmd", "pattern": 1, "name": "n"}],
+        [{"command": "cmd", "pattern": "pat", "name": "n"}, "not a dict"],
+        [{"command": "cmd", "pattern": "pat", "name": "n", "unknown": 1}],
+    ],
+)
+def test_with_tunnel_list_invalid_list(tunnel_list, tmp_path):
     with pytest.raises(ValueError):
-        Tunnel.with_tunnel_list(3000, [{"command": "cmd", "pattern": 1}])
+        Tunnel.with_tunnel_list(3000, tunnel_list, log_dir=tmp_path)
+    # the list is checked before the instance opens its log file
+    assert list(tmp_path.iterdir()) == []
 
 
 def test_add_tunnel():
@@ -103,12 +154,79 @@ def test_add_tunnel():
     assert len(tunnel.tunnel_list) == 2
 
 
+def test_start_tunnel_list_appended(mock_thread, tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd {port}", pattern="pat", name="n")
+    # tunnel_list is public, tunnels appended to it directly are started as well
+    tunnel.tunnel_list.append(
+        dict(command="true", pattern=re.compile("x"), name="d", note=None, callback=None)
+    )
+
+    tunnel._start(check_local_port=False)
+
+    cmds = ["cmd 3000", "true"] if tunnel.WINDOWS else [["cmd", "3000"], ["true"]]
+    run_args = [c.kwargs["args"][0] for c in mock_thread.call_args_list[1:]]
+    assert [t for group in run_args for t in group] == [
+        (0, cmds[0], "n"),
+        (1, cmds[1], "d"),
+    ]
+    assert tunnel.processes == [None, None]
+    assert tunnel._compiled_tunnels[1] == (re.compile("x"), None, "d", None)
+    tunnel.reset()
+
+
 def test_add_tunnel_invalid_value():
     tunnel = Tunnel(3000)
     with pytest.raises((ValueError, TypeError)):
         tunnel.add_tunnel(**{"command": "cmd", "pattern": re.compile("pat")})
 
 
+def test_pickle(tmp_path):
+    tunnel = Tunnel(3000, timeout=10, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd {port}", pattern=r"[\w-]+\.example\.com", name="n")
+
+    loaded = pickle.loads(pickle.dumps(tunnel))
+
+    assert loaded is not tunnel
+    assert (loaded.port, loaded.timeout, loaded.log_dir) == (3000, 10, tmp_path)
+    assert loaded.tunnel_list == tunnel.tunnel_list
+    loaded._prepare_tunnels()
+    loaded._process_line(b"https://abc.example.com")
+    assert loaded.urls == [("https://abc.example.com", None, "n")]
+
+
+def test_pickle_callback(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path, callback=print)
+    tunnel.add_tunnel(command="cmd", pattern="pat", name="n", callback=print)
+
+    loaded = pickle.loads(pickle.dumps(tunnel))
+    assert loaded.callback is print
+    assert loaded.tunnel_list[0]["callback"] is print
+
+    # callbacks are part of the state, so they must be picklable
+    tunnel.add_tunnel(command="cmd", pattern="pat", name="n2", callback=lambda *_: None)
+    with pytest.raises((pickle.PicklingError, AttributeError)):
+        pickle.dumps(tunnel)
+
+
+def test_pickle_default_log_dir(tmp_path, monkeypatch):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    monkeypatch.chdir(tmp_path / "a")
+    tunnel = Tunnel(3000)
+    tunnel.add_tunnel(command="cmd", pattern="pat", name="n")
+    data = pickle.dumps(tunnel)
+    for handler in tunnel.logger.handlers:
+        handler.close()
+    shutil.rmtree(tmp_path / "a")
+
+    # the default log_dir is the cwd of the process loading the tunnel
+    monkeypatch.chdir(tmp_path / "b")
+    loaded = pickle.loads(data)
+    assert Path(loaded.log_dir) == tmp_path / "b"
+    assert (tmp_path / "b" / "tunnel.log").exists()
+
+
 def test_reset():
     tunnel = Tunnel(3000)
     tunnel.reset()
@@ -127,31 +245,228 @@ def test_is_port_in_use(mock_socket):
 
     mock_sock_instance.connect_ex.return_value = 1
     assert not Tunnel.is_port_in_use(3000)
+    mock_sock_instance.connect_ex.assert_called_with(("127.0.0.1", 3000))
 
-    mock_sock_instance.connect_ex.bind.side_effect = Exception
+    mock_sock_instance.connect_ex.side_effect = OSError
     assert not Tunnel.is_port_in_use(3000)
 
 
-@pytest.mark.parametrize("result", [True, False])
-def test_wait_for_condition(result):
-    def condition():
-        return result
+def test_is_port_in_use_listening():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        port = s.getsockname()[1]
+        assert Tunnel.is_port_in_use(port)
+    assert not Tunnel.is_port_in_use(port)
+    assert not Tunnel.is_port_in_use(70000)
+
+
+@pytest.mark.parametrize("in_use", [True, False])
+def test__wait_port(in_use, tmp_path, mocker: MockerFixture):
+    mocker.patch.object(Tunnel, "is_port_in_use", return_value=in_use)
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.stop_event = mocker.MagicMock()
+    tunnel.stop_event.wait.return_value = True
 
-    assert Tunnel.wait_for_condition(condition, timeout=1) == result
+    tunnel._wait_port()
 
+    assert tunnel._port_up.is_set() == in_use
 
-def test__process_line(mocker: MockerFixture):
+
+def test__wait_event(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    event = Event()
+    event.set()
+    assert tunnel._wait_event(event, timeout=1)
+
+    event.clear()
+    assert not tunnel._wait_event(event, timeout=0.1)
+
+    tunnel.stop_event.set()
+    assert not tunnel._wait_event(event)
+
+
+def test__process_line(tmp_path, mocker: MockerFixture):
     mock_callback = mocker.MagicMock()
-    tunnel = Tunnel(3000)
+    tunnel = Tunnel(3000, log_dir=tmp_path)
     tunnel.add_tunnel(
         **{"command": "cmd", "pattern": "pat", "name": "n", "note": "nt", "callback": mock_callback}
     )
+    tunnel.add_tunnel(command="cmd", pattern=r"[\w-]+\.example\.com", name="n2")
+    tunnel._prepare_tunnels()
     link = "http://pat"
     note = "nt"
-    line = f"{link} {note}"
+    name = "n"
+    line = f"{link} {note}".encode()
     assert tunnel._process_line(line)
-    assert (link, note) in tunnel.urls
-    mock_callback.assert_called_with(link, note)
+    assert (link, note, name) in tunnel.urls
+    mock_callback.assert_called_with(link, note, name)
+
+    # scheme in the output is kept when the pattern doesn't include it
+    assert tunnel._process_line(b"url: https://abc.example.com")
+    assert ("https://abc.example.com", None, "n2") in tunnel.urls
+
+    # already matched tunnel is not matched again
+    assert tunnel._combined is None
+    assert not tunnel._process_line(line)
+    assert len(tunnel.urls) == 2
+
+
+def test__process_line_scheme(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    # patterns are kept as is, the scheme is taken from the output
+    tunnel.add_tunnel(command="cmd", pattern=r"a\.two\.com|b\.two\.com", name="n")
+    assert tunnel.tunnel_list[0]["pattern"].pattern == rb"a\.two\.com|b\.two\.com"
+
+    tunnel._prepare_tunnels()
+    assert tunnel._process_line(b"url: https://b.two.com")
+    assert tunnel.urls == [("https://b.two.com", None, "n")]
+
+    # leading global flags don't end up in the middle of the pattern
+    tunnel.add_tunnel(command="cmd", pattern=r"(?i)one\.com", name="n2")
+    assert tunnel.tunnel_list[1]["pattern"].pattern == rb"(?i)one\.com"
+
+
+def test__process_line_filled_by_other_thread(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd1", pattern="one", name="n1")
+    tunnel.add_tunnel(command="cmd2", pattern="two", name="n2")
+    tunnel._prepare_tunnels()
+    # another reader filled the last slot after this one compiled the regex
+    tunnel._url_slots[0] = ("http://one", None, "n1")
+
+    assert not tunnel._process_line(b"http://one")
+    assert tunnel.urls == [("http://one", None, "n1")]
+
+    # nothing left to combine once every slot is filled
+    tunnel._url_slots[1] = ("http://two", None, "n2")
+    assert tunnel._compile_combined() == (None, [])
+
+
+def test__process_line_urls_ready(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd1", pattern="one", name="n1")
+    tunnel.add_tunnel(command="cmd2", pattern="two", name="n2")
+    tunnel._prepare_tunnels()
+
+    assert tunnel._process_line(b"http://one")
+    assert not tunnel._urls_ready.is_set()
+    assert tunnel._process_line(b"http://two")
+    assert tunnel._urls_ready.is_set()
+
+    tunnel.reset()
+    assert not tunnel._urls_ready.is_set()
+
+
+def test__compile_combined(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd1", pattern=r"[\w-]+\.one\.com", name="n1")
+    tunnel.add_tunnel(command="cmd2", pattern=re.compile(r"two\.com", re.I), name="n2")
+    tunnel.add_tunnel(command="cmd3", pattern=r"(?P<t0>three)\.com", name="n3")
+    tunnel._prepare_tunnels()
+
+    combined, separate = tunnel._compile_combined()
+    assert separate == []
+    assert combined.search(b"url: abc.one.com").lastgroup == "_tunnel_0"
+    assert combined.search(b"url: TWO.com").lastgroup == "_tunnel_1"
+    assert combined.search(b"url: three.com").lastgroup == "_tunnel_2"
+
+    tunnel._url_slots[0] = ("http://abc.one.com", None, "n1")
+    combined, _ = tunnel._compile_combined()
+    assert combined.search(b"url: abc.one.com") is None
+
+
+@pytest.mark.parametrize(
+    "pattern, line, url",
+    [
+        (r"(\w+)-\1\.x\.com", b"url: https://ab-ab.x.com", "https://ab-ab.x.com"),
+        (
+            re.compile(r"[\w-]+\.y\.com  # host", re.VERBOSE),
+            b"url: abc.y.com",
+            "http://abc.y.com",
+        ),
+        (r"(?i)https://[\w-]+\.z\.com", b"url: https://ABC.z.com", "https://ABC.z.com"),
+    ],
+)
+def test__process_line_separate_pattern(pattern, line, url, tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd1", pattern=r"[\w-]+\.one\.com", name="n1")
+    tunnel.add_tunnel(command="cmd2", pattern=pattern, name="n2")
+    tunnel._prepare_tunnels()
+
+    # patterns that can't be embedded in the combined regex are searched one by one
+    combined, separate = tunnel._compile_combined()
+    assert combined.groupindex == {"_tunnel_0": 1}
+    assert separate == [1]
+
+    assert tunnel._process_line(line)
+    assert tunnel.urls == [(url, None, "n2")]
+    assert tunnel._process_line(b"url: abc.one.com")
+    assert tunnel._urls_ready.is_set()
+
+
+def test__compile_combined_error(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd1", pattern=r"(?P<host>one)\.com", name="n1")
+    tunnel.add_tunnel(command="cmd2", pattern=r"(?P<host>two)\.com", name="n2")
+    tunnel._prepare_tunnels()
+
+    assert tunnel._compile_combined() == (None, [0, 1])
+    assert tunnel._process_line(b"url: two.com")
+    assert tunnel.urls == [("http://two.com", None, "n2")]
+
+
+def test__process_line_non_ascii_pattern(tmp_path):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd1", pattern=r"[\w-]+\.one\.com", name="n1")
+    tunnel.add_tunnel(command="cmd2", pattern=r"[\wé]+\.deux\.fr", name="n2")
+    tunnel._prepare_tunnels()
+    assert isinstance(tunnel.tunnel_list[0]["pattern"].pattern, bytes)
+    # non-ASCII patterns are matched as text, not as UTF-8 bytes
+    assert tunnel.tunnel_list[1]["pattern"].pattern == r"[\wé]+\.deux\.fr"
+    assert tunnel._compile_combined()[1] == [1]
+
+    assert tunnel._process_line("url: https://café.deux.fr".encode())
+    assert tunnel.urls == [("https://café.deux.fr", None, "n2")]
+    assert tunnel._process_line(b"url: abc.one.com")
+    assert tunnel._compile_combined() == (None, [])
+
+
+def test__process_output(tmp_path, mocker: MockerFixture):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd", pattern="pat", name="n")
+    tunnel._prepare_tunnels()
+    log = tunnel._get_tunnel_logger("n")
+    output = _TunnelOutput(mocker.MagicMock(), log)
+
+    tunnel._process_output(output, b"first\nhttp://p")
+    assert output.buffer == b"http://p"
+    assert not output.url_extracted
+
+    tunnel._process_output(output, b"at\nlast")
+    assert output.url_extracted
+    assert list(tunnel.urls) == [("http://pat", None, "n")]
+
+    tunnel._process_output(output, b"")
+    assert output.buffer == b""
+
+    tunnel._process_output(output, b"one\r\ntwo\n")
+    for handler in log.handlers:
+        handler.close()
+    assert (tmp_path / "tunnel_n.log").read_text() == "first\nhttp://pat\nlast\none\ntwo\n"
+
+
+def test__process_output_all_urls_found(tmp_path, mocker: MockerFixture):
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel.add_tunnel(command="cmd", pattern="pat", name="n")
+    tunnel._url_slots = [("http://pat", None, "n")]
+    mock_process_line = mocker.patch.object(tunnel, "_process_line")
+    output = _TunnelOutput(mocker.MagicMock(), mocker.MagicMock())
+
+    tunnel._process_output(output, b"http://pat\n")
+
+    assert output.url_extracted
+    mock_process_line.assert_not_called()
 
 
 @pytest.mark.parametrize(
@@ -211,56 +526,98 @@ def test__print(
     mock_get_logger.return_value = mock_logger
     mock_callback = mocker.MagicMock()
 
-    mocker.patch.object(Tunnel, "wait_for_condition", return_value=wait_condition)
+    mocker.patch.object(Tunnel, "is_port_in_use", return_value=True)
     tunnel = Tunnel(3000)
-    tunnel.urls = [("http://example.com", None)]
-    tunnel.check_local_port = check_local_port
+    tunnel._urls_ready = mocker.MagicMock()
+    tunnel._urls_ready.wait.return_value = wait_condition
+    tunnel._url_slots = [("http://example.com", None, "n")]
     tunnel.callback = mock_callback
 
-    tunnel._print()
+    tunnel._print(check_local_port)
 
     mock_logger.info.assert_has_calls([mocker.call(c) for c in expected_info_calls])
+    assert tunnel._port_up.is_set() == check_local_port
     mock_callback.assert_called_with(tunnel.urls)
     if wait_condition is False:
         mock_logger.warning.assert_has_calls([mocker.call(c) for c in expected_warning_calls])
 
 
 @pytest.mark.parametrize(
-    "wait_condition, check_local_port, expected_debug_calls",
+    "check_local_port, expected_debug_calls",
     [
-        (True, True, ["Wait until port: 3000 online before running the command for test_tunnel"]),
-        (False, True, ["Wait until port: 3000 online before running the command for test_tunnel"]),
-        (True, False, []),
-        (False, False, []),
+        (True, ["Wait until port: 3000 online before running the command for test_tunnel"]),
+        (False, []),
     ],
 )
 def test__run(
     mock_get_logger,
     mock_popen,
-    wait_condition,
     check_local_port,
     expected_debug_calls,
+    tmp_path,
     mocker: MockerFixture,
 ):
     mock_logger = mocker.MagicMock()
     mock_get_logger.return_value = mock_logger
 
-    mocker.patch.object(Tunnel, "wait_for_condition", return_value=wait_condition)
-
-    tunnel = Tunnel(3000)
+    tunnel = Tunnel(3000, log_dir=tmp_path)
+    tunnel._port_up.set()
+    tunnel.add_tunnel(command="test_command", pattern=r"[\w-]+\.example\.com", name="test_tunnel")
+    tunnel._prepare_tunnels()
 
+    # feed the process output through a real pipe so it can be selected
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"starting\nurl: abc.example.com\nlast line")
+    os.close(write_fd)
     mock_popen_instance = mocker.MagicMock()
+    mock_popen_instance.stdout = os.fdopen(read_fd, "rb")
     mock_popen.return_value = mock_popen_instance
 
-    tunnel.check_local_port = check_local_port
-
     mock_child_logger = mocker.MagicMock()
     mock_get_logger.return_value.getChild.return_value = mock_child_logger
 
-    tunnel._run("test_command", "test_tunnel")
+    tunnel._run([(0, ["test_command"], "test_tunnel")], check_local_port)
+
+    assert tunnel.processes == [mock_popen_instance]
+
+    assert list(tunnel.urls) == [("http://abc.example.com", None, "test_tunnel")]
+    mock_child_logger.debug.assert_has_calls(
+        [mocker.call(c) for c in expected_debug_calls]
+        + [mocker.call("starting\nurl: abc.example.com"), mocker.call("last line")]
+    )
+
+
+@pytest.mark.skipif(os.name == "nt", reason="pipes can't be selected on Windows")
+def test__run_stop_pipe(mock_popen, tmp_path, mocker: MockerFixture):
+    tunnel = Tunnel(3000, check_local_port=False, log_dir=tmp_path)
+    tunnel.add_tunnel(command="test_command", pattern="pat", name="test_tunnel")
+    tunnel._prepare_tunnels()
+    tunnel._stop_pipe = os.pipe()
 
-    if check_local_port:
-        mock_child_logger.debug.assert_has_calls([mocker.call(c) for c in expected_debug_calls])
+    # the process output is never closed, only stop can end _run
+    read_fd, write_fd = os.pipe()
+    mock_popen_instance = mocker.MagicMock()
+    mock_popen_instance.stdout = os.fdopen(read_fd, "rb")
+    spawned = Event()
+
+    def popen(*args, **kwargs):
+        spawned.set()
+        return mock_popen_instance
+
+    mock_popen.side_effect = popen
+
+    job = Thread(target=tunnel._run, args=([(0, ["test_command"], "test_tunnel")], False))
+    job.start()
+    assert spawned.wait(timeout=5)
+    tunnel.stop_event.set()
+    os.write(tunnel._stop_pipe[1], b"\0")
+    job.join(timeout=5)
+
+    assert not job.is_alive()
+    assert mock_popen_instance.stdout.closed
+    os.close(write_fd)
+    tunnel.reset()
+    assert tunnel._stop_pipe is None
 
 
 def test_start(